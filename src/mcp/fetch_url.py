@@ -4,30 +4,313 @@ Simple MCP server that fetches URL content and returns it as UTF-8 text.
 """
 
 import asyncio
-import json
+import base64
+import codecs
+import contextlib
+import functools
+import os
+import re
 import sys
-from typing import Any, Dict, List, Optional
+import time
+import urllib.request
+from typing import (
+    Any, AsyncIterable, AsyncIterator, Dict, Iterable, Iterator, List,
+    Optional, Tuple, Union,
+)
+import httpcore
 import httpx
-from urllib.parse import urlparse
-from html.parser import HTMLParser
+import orjson
+from selectolax.lexbor import LexborHTMLParser
 
 
-class HTMLStripper(HTMLParser):
-    """Utility class to strip HTML tags from content"""
-    def __init__(self):
-        super().__init__()
-        self.reset()
-        self.fed = []
+# Remember the address each host last connected on for five minutes, for at
+# most 4096 hosts
+_DNS_CACHE_TTL = 300
+_DNS_CACHE_SIZE = 4096
+
+# Head start given to a cached address before also connecting by host name,
+# the same delay happy eyeballs (RFC 8305) uses between attempts
+_DNS_FALLBACK_DELAY = 0.25
+
+
+class _CachedDNSBackend(httpcore.AsyncNetworkBackend):
+    """Network backend that reconnects to the address a host last worked on
+
+    A cache miss connects by host name, so the wrapped backend resolves it
+    and races its addresses. A cache hit connects straight to the cached
+    address, and also by host name if that fails or is slow to connect.
+    """
+
+    def __init__(self, backend: httpcore.AsyncNetworkBackend):
+        self._backend = backend
+        self._cache: Dict[str, Tuple[float, str]] = {}
+
+    def _lookup(self, host: str) -> Optional[str]:
+        """Return the cached address for host, if it has not expired"""
+        cached = self._cache.get(host)
+        if cached is None:
+            return None
+        if cached[0] <= time.monotonic():
+            del self._cache[host]
+            return None
+        return cached[1]
+
+    def _remember(self, host: str, stream: httpcore.AsyncNetworkStream) -> None:
+        """Cache the address stream connected to as the one for host"""
+        server_addr = stream.get_extra_info("server_addr")
+        if server_addr is None or server_addr[0] == host:
+            return
+
+        self._cache.pop(host, None)
+        if len(self._cache) >= _DNS_CACHE_SIZE:
+            # Evict the oldest entry
+            self._cache.pop(next(iter(self._cache)))
+        self._cache[host] = (time.monotonic() + _DNS_CACHE_TTL, server_addr[0])
+
+    async def connect_tcp(
+        self,
+        host: str,
+        port: int,
+        timeout: Optional[float] = None,
+        local_address: Optional[str] = None,
+        socket_options: Optional[Iterable[Any]] = None,
+    ) -> httpcore.AsyncNetworkStream:
+        connect = functools.partial(
+            self._backend.connect_tcp,
+            port=port,
+            timeout=timeout,
+            local_address=local_address,
+            socket_options=socket_options,
+        )
+
+        address = self._lookup(host)
+        if address is None:
+            stream = await connect(host)
+            self._remember(host, stream)
+            return stream
+
+        cached = asyncio.create_task(connect(address))
+        fallback = None
+        pending = {cached}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending,
+                    timeout=None if fallback else _DNS_FALLBACK_DELAY,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                streams = []
+                for task in done:
+                    if task.exception() is None:
+                        streams.append(task.result())
+                    elif task is cached:
+                        # The address may be stale; drop it and rely on
+                        # the host name attempt
+                        self._cache.pop(host, None)
+
+                if streams:
+                    # Keep one stream and close any that tied with it
+                    for extra in streams[1:]:
+                        await extra.aclose()
+                    if fallback in done and fallback.exception() is None:
+                        self._remember(host, streams[0])
+                    return streams[0]
+
+                if fallback is None:
+                    fallback = asyncio.create_task(connect(host))
+                    pending.add(fallback)
+
+            raise fallback.exception()
+        finally:
+            for task in pending:
+                task.cancel()
+            for result in await asyncio.gather(*pending, return_exceptions=True):
+                if isinstance(result, httpcore.AsyncNetworkStream):
+                    await result.aclose()
+
+    async def connect_unix_socket(
+        self,
+        path: str,
+        timeout: Optional[float] = None,
+        socket_options: Optional[Iterable[Any]] = None,
+    ) -> httpcore.AsyncNetworkStream:
+        return await self._backend.connect_unix_socket(
+            path, timeout=timeout, socket_options=socket_options
+        )
+
+    async def sleep(self, seconds: float) -> None:
+        await self._backend.sleep(seconds)
+
+
+@contextlib.contextmanager
+def _map_httpcore_errors() -> Iterator[None]:
+    """Re-raise httpcore errors as the httpx errors of the same name"""
+    try:
+        yield
+    except Exception as e:
+        # httpx mirrors httpcore's exception hierarchy name for name, so
+        # the most specific httpcore class with an httpx twin wins
+        for cls in type(e).__mro__:
+            httpx_error = getattr(httpx, cls.__name__, None)
+            if getattr(httpcore, cls.__name__, None) is cls and httpx_error:
+                raise httpx_error(str(e)) from e
+        raise
+
+
+class _ResponseStream(httpx.AsyncByteStream):
+    """httpx response body backed by an httpcore response stream"""
+
+    def __init__(self, stream: AsyncIterable[bytes]):
+        self._stream = stream
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        with _map_httpcore_errors():
+            async for part in self._stream:
+                yield part
+
+    async def aclose(self) -> None:
+        if hasattr(self._stream, "aclose"):
+            await self._stream.aclose()
+
+
+class _CachedDNSTransport(httpx.AsyncBaseTransport):
+    """HTTP transport whose connection pool resolves hosts via _CachedDNSBackend"""
+
+    def __init__(self, http2: bool, limits: httpx.Limits):
+        self._pool = httpcore.AsyncConnectionPool(
+            ssl_context=httpx.create_ssl_context(),
+            max_connections=limits.max_connections,
+            max_keepalive_connections=limits.max_keepalive_connections,
+            keepalive_expiry=limits.keepalive_expiry,
+            http2=http2,
+            network_backend=_CachedDNSBackend(httpcore.AnyIOBackend()),
+        )
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        core_request = httpcore.Request(
+            method=request.method,
+            url=httpcore.URL(
+                scheme=request.url.raw_scheme,
+                host=request.url.raw_host,
+                port=request.url.port,
+                target=request.url.raw_path,
+            ),
+            headers=request.headers.raw,
+            content=request.stream,
+            extensions=request.extensions,
+        )
+        with _map_httpcore_errors():
+            core_response = await self._pool.handle_async_request(core_request)
 
-    def handle_data(self, d):
-        self.fed.append(d)
+        return httpx.Response(
+            status_code=core_response.status,
+            headers=core_response.headers,
+            stream=_ResponseStream(core_response.stream),
+            extensions=core_response.extensions,
+        )
 
-    def get_data(self):
-        return ''.join(self.fed)
+    async def aclose(self) -> None:
+        await self._pool.aclose()
 
-    def strip_html(self, html):
-        self.feed(html)
-        return self.get_data()
+
+_LIMITS = httpx.Limits(
+    max_keepalive_connections=20,
+    max_connections=100,
+    keepalive_expiry=30,
+)
+
+# Direct connections go through the DNS-caching transport. The "all://"
+# mount is the least specific pattern, so HTTP(S)_PROXY mounts from the
+# environment still take precedence; an ALL_PROXY setting would share its
+# key and be replaced, so the mount is skipped when one is configured.
+if urllib.request.getproxies().get('all'):
+    _MOUNTS = None
+else:
+    _MOUNTS = {"all://": _CachedDNSTransport(http2=True, limits=_LIMITS)}
+
+# Shared client so repeated fetches reuse pooled (and HTTP/2 multiplexed)
+# connections instead of paying a fresh TCP + TLS handshake per call.
+_CLIENT = httpx.AsyncClient(
+    http2=True,
+    timeout=httpx.Timeout(10.0),
+    limits=_LIMITS,
+    mounts=_MOUNTS,
+)
+
+# Read response bodies in 64 KiB chunks and give up past 50 MiB
+_CHUNK_SIZE = 64 * 1024
+_MAX_BODY_BYTES = 50 * 1024 * 1024
+
+# Only the first 64 KiB of an error body is kept for the error message
+_MAX_ERROR_BODY_BYTES = 64 * 1024
+
+# Content types stripped to plain text; an empty type means the server
+# sent no Content-Type header
+_HTML_CONTENT_TYPES = frozenset({'', 'text/html', 'application/xhtml+xml'})
+
+# Non-text/* content types that are still returned as decoded text
+_TEXT_CONTENT_TYPES = frozenset({
+    'application/json',
+    'application/xml',
+    'application/javascript',
+})
+
+# Longest JSON-RPC request line accepted on stdin
+_MAX_LINE_BYTES = 16 * 1024 * 1024
+
+# Most requests accepted in a single JSON-RPC batch
+_MAX_BATCH_SIZE = 500
+
+
+# An http(s) scheme followed by a non-empty host
+_URL_RE = re.compile(r'^https?://[^/?#\s]+', re.IGNORECASE)
+
+
+def _stdin_shares_stdout() -> bool:
+    """Check whether stdin and stdout are the same file (socketpair or TTY)"""
+    try:
+        a = os.fstat(sys.stdin.fileno())
+        b = os.fstat(sys.stdout.fileno())
+    except (OSError, ValueError):
+        return False
+    return (a.st_dev, a.st_ino) == (b.st_dev, b.st_ino)
+
+
+def _is_valid_url(url: str) -> bool:
+    """Basic URL validation"""
+    return _URL_RE.match(url) is not None
+
+
+async def _read_body(
+    response: httpx.Response, limit: int, truncate: bool = False
+) -> bytes:
+    """Read a streamed response body of at most limit bytes
+
+    Past the limit the body is cut short when truncate is set, and
+    otherwise rejected.
+    """
+    chunks = []
+    size = 0
+    async for chunk in response.aiter_bytes(_CHUNK_SIZE):
+        size += len(chunk)
+        if size > limit:
+            if not truncate:
+                raise RuntimeError(f"Response body exceeds {limit} bytes")
+            chunks.append(chunk[:len(chunk) - (size - limit)])
+            break
+        chunks.append(chunk)
+    return b''.join(chunks)
+
+
+def _response_encoding(response: httpx.Response) -> str:
+    """Return the normalized codec name for a response's declared charset
+
+    Unknown or missing charsets fall back to UTF-8.
+    """
+    try:
+        return codecs.lookup(response.charset_encoding or 'utf-8').name
+    except LookupError:
+        return 'utf-8'
 
 
 class MCPServer:
@@ -37,7 +320,11 @@ class MCPServer:
         self.tools = {
             "fetch_url": {
                 "name": "fetch_url",
-                "description": "Fetch content from a URL and return it as UTF-8 text",
+                "description": (
+                    "Fetch content from a URL and return it as UTF-8 text. "
+                    "HTML is reduced to plain text and binary content is "
+                    "returned as a base64 data: URI"
+                ),
                 "inputSchema": {
                     "type": "object",
                     "properties": {
@@ -55,158 +342,262 @@ class MCPServer:
                 }
             }
         }
-    
-    def _is_valid_url(self, url: str) -> bool:
-        """Basic URL validation"""
-        try:
-            result = urlparse(url)
-            return all([result.scheme, result.netloc])
-        except Exception:
-            return False
+        # Tool metadata never changes, so build the tools/list result once
+        # and keep a pre-encoded copy for _write_response to splice in
+        self._tools_list = {"tools": list(self.tools.values())}
+        self._tools_list_json = orjson.Fragment(orjson.dumps(self._tools_list))
+        # A batch can hold more fetches than the pool has connections, so
+        # queue them here instead of letting the extras hit PoolTimeout
+        self._fetch_slots = asyncio.Semaphore(_LIMITS.max_connections)
+        self._handlers = {
+            "initialize": self._handle_initialize,
+            "notifications/initialized": self._handle_initialized,
+            "tools/list": self._handle_tools_list,
+            "tools/call": self._handle_tools_call,
+        }
     
     async def _fetch_url_content(self, url: str, timeout: float = 10) -> str:
-        """Fetch content from URL, strip HTML, and return as plain text"""
-        if not self._is_valid_url(url):
+        """Fetch content from URL and return it as text
+
+        HTML is reduced to its plain text, other textual content types are
+        returned decoded, and binary content is returned as a data: URI.
+        """
+        if not _is_valid_url(url):
             raise ValueError(f"Invalid URL: {url}")
 
-        async with httpx.AsyncClient(timeout=timeout) as client:
-            try:
-                response = await client.get(url, follow_redirects=True)
-                response.raise_for_status()
+        try:
+            async with _CLIENT.stream(
+                'GET', url, follow_redirects=True, timeout=timeout
+            ) as response:
+                if not response.is_success:
+                    # Keep only the start of an error body for the message
+                    error_body = await _read_body(
+                        response, _MAX_ERROR_BODY_BYTES, truncate=True
+                    )
+                    error_text = error_body.decode(
+                        _response_encoding(response), errors='replace'
+                    )
+                    raise RuntimeError(
+                        f"HTTP error {response.status_code}: {error_text}"
+                    )
 
-                # Try to decode as UTF-8, with fallback handling
-                try:
-                    content = response.content.decode('utf-8')
-                except UnicodeDecodeError:
-                    # Try to detect encoding from response headers
-                    encoding = response.encoding or 'utf-8'
-                    content = response.content.decode(encoding, errors='replace')
+                body = await _read_body(response, _MAX_BODY_BYTES)
+
+            content_type = response.headers.get('content-type', '')
+            content_type = content_type.split(';', 1)[0].strip().lower()
+            encoding = _response_encoding(response)
+
+            # Only HTML (or an unlabelled body) goes through the parser
+            if content_type in _HTML_CONTENT_TYPES:
+                # The parser reads UTF-8 bytes directly, so only decode up
+                # front when the response declares some other charset
+                if encoding == 'utf-8':
+                    content = body
+                else:
+                    content = body.decode(encoding, errors='replace')
 
                 # Strip HTML tags
-                stripper = HTMLStripper()
-                plain_text = stripper.strip_html(content)
+                return LexborHTMLParser(content).text(separator=' ')
 
-                return plain_text
+            # Other textual formats are returned as-is
+            if (content_type.startswith('text/')
+                    or content_type in _TEXT_CONTENT_TYPES
+                    or content_type.endswith(('+json', '+xml'))):
+                return body.decode(encoding, errors='replace')
 
-            except httpx.RequestError as e:
-                raise RuntimeError(f"Request failed: {str(e)}")
-            except httpx.HTTPStatusError as e:
-                raise RuntimeError(f"HTTP error {e.response.status_code}: {e.response.text}")
+            # Binary bodies are returned as a base64 data: URI
+            return f"data:{content_type};base64,{base64.b64encode(body).decode('ascii')}"
+
+        except httpx.RequestError as e:
+            raise RuntimeError(f"Request failed: {str(e)}")
     
-    async def handle_request(self, request: Dict[str, Any]) -> Dict[str, Any]:
+    async def _handle_initialize(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """Handle the initialize handshake"""
+        return {
+            "protocolVersion": "2024-11-05",
+            "capabilities": {
+                "tools": {}
+            },
+            "serverInfo": {
+                "name": "url-fetcher",
+                "version": "1.0.0"
+            }
+        }
+
+    async def _handle_initialized(self, params: Dict[str, Any]) -> None:
+        """Handle the initialized notification"""
+        # No response needed for notifications
+        return None
+
+    async def _handle_tools_list(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """List the available tools"""
+        return self._tools_list
+
+    async def _handle_tools_call(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """Call a tool by name"""
+        tool_name = params.get("name")
+        arguments = params.get("arguments", {})
+
+        if tool_name == "fetch_url":
+            url = arguments.get("url")
+            timeout = arguments.get("timeout", 10)
+
+            if not url:
+                raise ValueError("URL is required")
+
+            async with self._fetch_slots:
+                content = await self._fetch_url_content(url, timeout)
+
+            return {
+                "content": [
+                    {
+                        "type": "text",
+                        "text": content
+                    }
+                ]
+            }
+        else:
+            raise ValueError(f"Unknown tool: {tool_name}")
+
+    async def handle_request(self, request: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         """Handle incoming MCP requests"""
-        method = request.get("method")
-        params = request.get("params", {})
+        if not isinstance(request, dict):
+            return self._error_response(None, "Invalid request", -32600)
+
         request_id = request.get("id")
-        
+
         try:
-            if method == "initialize":
-                return {
-                    "jsonrpc": "2.0",
-                    "id": request_id,
-                    "result": {
-                        "protocolVersion": "2024-11-05",
-                        "capabilities": {
-                            "tools": {}
-                        },
-                        "serverInfo": {
-                            "name": "url-fetcher",
-                            "version": "1.0.0"
-                        }
-                    }
-                }
-            
-            elif method == "tools/list":
-                return {
-                    "jsonrpc": "2.0",
-                    "id": request_id,
-                    "result": {
-                        "tools": list(self.tools.values())
-                    }
-                }
-            
-            elif method == "tools/call":
-                tool_name = params.get("name")
-                arguments = params.get("arguments", {})
-                
-                if tool_name == "fetch_url":
-                    url = arguments.get("url")
-                    timeout = arguments.get("timeout", 10)
-                    
-                    if not url:
-                        raise ValueError("URL is required")
-                    
-                    content = await self._fetch_url_content(url, timeout)
-                    
-                    return {
-                        "jsonrpc": "2.0",
-                        "id": request_id,
-                        "result": {
-                            "content": [
-                                {
-                                    "type": "text",
-                                    "text": content
-                                }
-                            ]
-                        }
-                    }
-                else:
-                    raise ValueError(f"Unknown tool: {tool_name}")
-            
-            elif method == "notifications/initialized":
-                # No response needed for notifications
-                return None
-            
-            else:
+            method = request.get("method")
+            handler = self._handlers.get(method)
+            if handler is None:
                 raise ValueError(f"Unknown method: {method}")
-                
-        except Exception as e:
+
+            result = await handler(request.get("params", {}))
+            if result is None:
+                return None
+
             return {
                 "jsonrpc": "2.0",
                 "id": request_id,
-                "error": {
-                    "code": -32603,
-                    "message": str(e)
-                }
+                "result": result
             }
+
+        except Exception as e:
+            return self._error_response(request_id, str(e))
     
     async def run(self):
         """Run the MCP server"""
+        try:
+            await self._serve()
+        finally:
+            await _CLIENT.aclose()
+
+    async def _serve(self):
+        """Read requests from stdin and handle each one as its own task"""
+        loop = asyncio.get_running_loop()
+        reader = asyncio.StreamReader(limit=_MAX_LINE_BYTES)
+        try:
+            if _stdin_shares_stdout():
+                # connect_read_pipe would make the shared file non-blocking
+                # and break the synchronous writes to stdout
+                raise ValueError("stdin shares its file with stdout")
+            await loop.connect_read_pipe(
+                lambda: asyncio.StreamReaderProtocol(reader), sys.stdin
+            )
+            readline = reader.readline
+        except ValueError:
+            # Pipe transports reject regular files (e.g. stdin redirected
+            # from a file), so read those lines in the executor instead
+            readline = functools.partial(
+                loop.run_in_executor, None, sys.stdin.buffer.readline
+            )
+
+        tasks = set()
         while True:
             try:
-                # Read JSON-RPC request from stdin
-                line = await asyncio.get_event_loop().run_in_executor(
-                    None, sys.stdin.readline
+                line = await readline()
+            except ValueError as e:
+                # Line exceeded the reader limit; it has been discarded
+                self._write_error(None, f"Server error: {str(e)}")
+                continue
+
+            if not line:
+                break
+
+            task = asyncio.create_task(self._dispatch(line))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+        # Let in-flight requests finish before shutting down
+        if tasks:
+            await asyncio.gather(*tasks)
+
+    async def _dispatch(self, line: bytes) -> None:
+        """Decode and handle a single request line"""
+        try:
+            try:
+                request = orjson.loads(line)
+            except orjson.JSONDecodeError:
+                return
+
+            # Handle the request, or every request in a batch concurrently
+            if isinstance(request, list):
+                if not request or len(request) > _MAX_BATCH_SIZE:
+                    self._write_error(
+                        None,
+                        f"Batch must contain 1 to {_MAX_BATCH_SIZE} requests",
+                        -32600
+                    )
+                    return
+                responses = await asyncio.gather(
+                    *(self.handle_request(r) for r in request)
                 )
-                
-                if not line:
-                    break
-                
-                try:
-                    request = json.loads(line.strip())
-                except json.JSONDecodeError:
-                    continue
-                
-                # Handle the request
+                response = [r for r in responses if r is not None] or None
+            else:
                 response = await self.handle_request(request)
-                
-                # Send response to stdout (if not None)
-                if response is not None:
-                    print(json.dumps(response), flush=True)
-                    
-            except KeyboardInterrupt:
-                break
-            except Exception as e:
-                # Log error but continue running
-                error_response = {
-                    "jsonrpc": "2.0",
-                    "id": None,
-                    "error": {
-                        "code": -32603,
-                        "message": f"Server error: {str(e)}"
-                    }
-                }
-                print(json.dumps(error_response), flush=True)
+
+            # Send response to stdout (if not None). The write itself never
+            # yields, so concurrent responses cannot interleave.
+            if response is not None:
+                self._write_response(response)
+
+        except Exception as e:
+            # Log error but continue running
+            self._write_error(None, f"Server error: {str(e)}")
+
+    def _error_response(
+        self, request_id: Any, message: str, code: int = -32603
+    ) -> Dict[str, Any]:
+        """Build a JSON-RPC error response (internal error by default)"""
+        return {
+            "jsonrpc": "2.0",
+            "id": request_id,
+            "error": {
+                "code": code,
+                "message": message
+            }
+        }
+
+    def _write_error(
+        self, request_id: Any, message: str, code: int = -32603
+    ) -> None:
+        """Write a JSON-RPC error response to stdout"""
+        self._write_response(self._error_response(request_id, message, code))
+
+    def _with_encoded_result(self, response: Dict[str, Any]) -> Dict[str, Any]:
+        """Swap a cached result for its pre-encoded JSON, if it has one"""
+        if response.get("result") is self._tools_list:
+            return {**response, "result": self._tools_list_json}
+        return response
+
+    def _write_response(self, response: Union[Dict[str, Any], List[Dict[str, Any]]]) -> None:
+        """Write one JSON-RPC response line to stdout"""
+        if isinstance(response, list):
+            response = [self._with_encoded_result(r) for r in response]
+        else:
+            response = self._with_encoded_result(response)
+        sys.stdout.buffer.write(orjson.dumps(response) + b"\n")
+        sys.stdout.buffer.flush()
 
 
 def main():
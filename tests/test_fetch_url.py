@@ -0,0 +1,302 @@
+import asyncio
+import base64
+import http.server
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import httpcore
+import orjson
+import pytest
+
+from mcp import fetch_url
+from mcp.fetch_url import (
+    _LIMITS, _MAX_BATCH_SIZE, MCPServer, _CachedDNSBackend,
+)
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(__file__)), "src")
+
+BIG_BODY = b"a" * (8 * 1024 * 1024)
+PNG_BODY = b"\x89PNG\r\n\x1a\n\x00\xff"
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    """Serves canned responses keyed by path"""
+
+    routes = {
+        "/big": ("text/plain", BIG_BODY),
+        "/untyped": ("", b"<html><body><p>Hello</p></body></html>"),
+        "/ld+json": ("application/ld+json", b'{"name": "x"}'),
+        "/atom": ("application/atom+xml; charset=utf-8", b"<feed/>"),
+        "/png": ("image/png", PNG_BODY),
+        "/bogus.html": (
+            "text/html; charset=x-bogus",
+            "<p>caf\u00e9</p>".encode("utf-8"),
+        ),
+        "/bogus.txt": ("text/plain; charset=x-bogus", "caf\u00e9".encode("utf-8")),
+    }
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        content_type, body = self.routes[self.path]
+        self.send_response(200)
+        if content_type is not None:
+            self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture(scope="module")
+def base_url():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def _fetch_request(request_id, url):
+    return {
+        "jsonrpc": "2.0",
+        "id": request_id,
+        "method": "tools/call",
+        "params": {"name": "fetch_url", "arguments": {"url": url}},
+    }
+
+
+def _read_lines(sock, count):
+    """Read count newline-terminated lines from sock"""
+    data = b""
+    while data.count(b"\n") < count:
+        chunk = sock.recv(1024 * 1024)
+        assert chunk, f"connection closed after {len(data)} bytes"
+        data += chunk
+    return data.splitlines()[:count]
+
+
+def test_large_response_over_shared_stdin_stdout_socket(base_url):
+    parent, child = socket.socketpair()
+    parent.settimeout(10)
+    with parent, child:
+        process = subprocess.Popen(
+            [sys.executable, "-m", "mcp.fetch_url"],
+            stdin=child,
+            stdout=child,
+            stderr=subprocess.PIPE,
+            env={**os.environ, "PYTHONPATH": SRC},
+        )
+        child.close()
+
+        requests = [
+            _fetch_request(1, f"{base_url}/big"),
+            {"jsonrpc": "2.0", "id": 2, "method": "initialize"},
+        ]
+        parent.sendall(b"".join(orjson.dumps(r) + b"\n" for r in requests))
+
+        responses = {}
+        for line in _read_lines(parent, len(requests)):
+            response = orjson.loads(line)
+            responses[response["id"]] = response
+        parent.shutdown(socket.SHUT_WR)
+
+        _, stderr = process.communicate(timeout=30)
+
+    text = responses[1]["result"]["content"][0]["text"]
+    assert text == BIG_BODY.decode()
+    assert "serverInfo" in responses[2]["result"]
+    assert stderr == b""
+
+
+def _batch_output(server, capsysbinary, request):
+    """Dispatch request as one line and return the decoded output lines"""
+    asyncio.run(server._dispatch(orjson.dumps(request)))
+    out = capsysbinary.readouterr().out
+    return [orjson.loads(line) for line in out.splitlines()]
+
+
+def test_empty_batch_is_invalid(capsysbinary):
+    [response] = _batch_output(MCPServer(), capsysbinary, [])
+    assert response["id"] is None
+    assert response["error"]["code"] == -32600
+
+
+def test_oversized_batch_is_invalid(capsysbinary):
+    request = [{"jsonrpc": "2.0", "id": i, "method": "initialize"}
+               for i in range(_MAX_BATCH_SIZE + 1)]
+    [response] = _batch_output(MCPServer(), capsysbinary, request)
+    assert response["id"] is None
+    assert response["error"]["code"] == -32600
+
+
+def test_non_object_batch_entry_is_invalid(capsysbinary):
+    [responses] = _batch_output(MCPServer(), capsysbinary, [1])
+    assert responses == [{
+        "jsonrpc": "2.0",
+        "id": None,
+        "error": {"code": -32600, "message": "Invalid request"},
+    }]
+
+
+def test_notification_only_batch_writes_nothing(capsysbinary):
+    notification = {"jsonrpc": "2.0", "method": "notifications/initialized"}
+    assert _batch_output(MCPServer(), capsysbinary, [notification] * 3) == []
+
+
+def test_mixed_batch(capsysbinary):
+    request = [
+        {"jsonrpc": "2.0", "id": 1, "method": "tools/list"},
+        {"jsonrpc": "2.0", "method": "notifications/initialized"},
+        "bogus",
+        {"jsonrpc": "2.0", "id": 2, "method": "no/such/method"},
+    ]
+    [responses] = _batch_output(MCPServer(), capsysbinary, request)
+    assert [r["id"] for r in responses] == [1, None, 2]
+    assert responses[0]["result"]["tools"][0]["name"] == "fetch_url"
+    assert responses[1]["error"]["code"] == -32600
+    assert responses[2]["error"]["code"] == -32603
+
+
+def test_batch_fetches_are_bounded_by_pool_size(capsysbinary):
+    server = MCPServer()
+    active = 0
+    peak = 0
+
+    async def fake_fetch(url, timeout=10):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+        return url
+
+    server._fetch_url_content = fake_fetch
+    request = [_fetch_request(i, f"http://example.com/{i}")
+               for i in range(_MAX_BATCH_SIZE)]
+    [responses] = _batch_output(server, capsysbinary, request)
+
+    assert len(responses) == _MAX_BATCH_SIZE
+    assert all("result" in r for r in responses)
+    assert peak == _LIMITS.max_connections
+
+
+@pytest.mark.asyncio(loop_scope="module")
+@pytest.mark.parametrize("path, expected", [
+    ("/untyped", "Hello"),
+    ("/ld+json", '{"name": "x"}'),
+    ("/atom", "<feed/>"),
+    ("/png", "data:image/png;base64," + base64.b64encode(PNG_BODY).decode()),
+    ("/bogus.html", "caf\u00e9"),
+    ("/bogus.txt", "caf\u00e9"),
+])
+async def test_content_type_routing(base_url, path, expected):
+    content = await MCPServer()._fetch_url_content(base_url + path)
+    assert content.strip() == expected
+
+
+class _FakeStream(httpcore.AsyncNetworkStream):
+    """Network stream that only knows the address it connected to"""
+
+    def __init__(self, address):
+        self.address = address
+        self.closed = False
+
+    async def read(self, max_bytes, timeout=None):
+        return b""
+
+    async def write(self, buffer, timeout=None):
+        pass
+
+    async def aclose(self):
+        self.closed = True
+
+    def get_extra_info(self, info):
+        return (self.address, 443) if info == "server_addr" else None
+
+
+class _FakeBackend(httpcore.AsyncNetworkBackend):
+    """Resolves host names from a dict and never answers blackholed addresses"""
+
+    def __init__(self, hosts):
+        self.hosts = hosts
+        self.blackholed = set()
+        self.lookups = 0
+
+    async def connect_tcp(self, host, port, timeout=None, local_address=None,
+                          socket_options=None):
+        if host in self.hosts:
+            self.lookups += 1
+            host = self.hosts[host]
+        elif not host[0].isdigit() and ":" not in host:
+            raise httpcore.ConnectError(f"Name or service not known: {host}")
+        if host in self.blackholed:
+            await asyncio.sleep(timeout)
+            raise httpcore.ConnectTimeout(f"Timed out connecting to {host}")
+        return _FakeStream(host)
+
+
+@pytest.mark.asyncio
+async def test_blackholed_cached_address_falls_back_quickly():
+    fake = _FakeBackend({"example.com": "2001:db8::1"})
+    backend = _CachedDNSBackend(fake)
+    await backend.connect_tcp("example.com", 443, timeout=2.0)
+
+    fake.blackholed.add("2001:db8::1")
+    fake.hosts["example.com"] = "192.0.2.1"
+    start = time.monotonic()
+    stream = await backend.connect_tcp("example.com", 443, timeout=2.0)
+
+    assert time.monotonic() - start < 1.0
+    assert stream.address == "192.0.2.1"
+    assert backend._lookup("example.com") == "192.0.2.1"
+
+
+@pytest.mark.asyncio
+async def test_cache_hit_skips_lookup():
+    fake = _FakeBackend({"example.com": "192.0.2.1"})
+    backend = _CachedDNSBackend(fake)
+    await backend.connect_tcp("example.com", 443)
+    stream = await backend.connect_tcp("example.com", 443)
+
+    assert stream.address == "192.0.2.1"
+    assert fake.lookups == 1
+
+
+@pytest.mark.asyncio
+async def test_cache_entries_expire(monkeypatch):
+    monkeypatch.setattr(fetch_url, "_DNS_CACHE_TTL", 0)
+    fake = _FakeBackend({"example.com": "192.0.2.1"})
+    backend = _CachedDNSBackend(fake)
+    await backend.connect_tcp("example.com", 443)
+    await backend.connect_tcp("example.com", 443)
+
+    assert fake.lookups == 2
+
+
+@pytest.mark.asyncio
+async def test_cache_evicts_oldest_host(monkeypatch):
+    monkeypatch.setattr(fetch_url, "_DNS_CACHE_SIZE", 2)
+    fake = _FakeBackend({"a.test": "192.0.2.1", "b.test": "192.0.2.2",
+                         "c.test": "192.0.2.3"})
+    backend = _CachedDNSBackend(fake)
+    for host in ("a.test", "b.test", "c.test"):
+        await backend.connect_tcp(host, 443)
+
+    assert backend._lookup("a.test") is None
+    assert backend._lookup("b.test") == "192.0.2.2"
+    assert backend._lookup("c.test") == "192.0.2.3"
+
+
+@pytest.mark.asyncio
+async def test_lookup_failure_is_raised_and_not_cached():
+    backend = _CachedDNSBackend(_FakeBackend({}))
+    with pytest.raises(httpcore.ConnectError):
+        await backend.connect_tcp("missing.test", 443)
+
+    assert backend._lookup("missing.test") is None